@@ -1,21 +1,39 @@
 #!/usr/bin/env python3
 import sys
+import logging
 import os
+import stat
 from pathlib import Path
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QLineEdit, 
-                            QFileDialog, QComboBox, QListWidget, QMessageBox,
+                            QFileDialog, QComboBox, QListView, QMessageBox,
                             QGroupBox, QFormLayout, QSpinBox, QTabWidget)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QModelIndex, QStringListModel, pyqtSignal
 from PyQt5.QtGui import QIcon, QFont
 
-from windows_vm import WindowsVM
+from windows_vm import DEFAULT_VM_BASE_DIR, WindowsVM
+
+def _is_iso_file(path):
+    """Check with a single stat that path exists and is not a directory"""
+    # Block devices such as /dev/sr0 are valid QEMU -cdrom sources
+    try:
+        return not stat.S_ISDIR(os.stat(path).st_mode)
+    except OSError:
+        return False
 
 class VMWorker(QThread):
     """Worker thread to perform VM operations without blocking the UI"""
     finished = pyqtSignal(bool, str)
     progress = pyqtSignal(str)
     
+    # operation -> (progress message, WindowsVM method)
+    _OPS = {
+        "create": ("Creating VM...", WindowsVM.create),
+        "start": ("Starting VM...", WindowsVM.start),
+        "stop": ("Stopping VM...", WindowsVM.stop),
+        "delete": ("Deleting VM...", WindowsVM.delete),
+    }
+    
     def __init__(self, operation, vm):
         super().__init__()
         self.operation = operation
@@ -23,19 +41,9 @@ class VMWorker(QThread):
     
     def run(self):
         try:
-            result = False
-            if self.operation == "create":
-                self.progress.emit("Creating VM...")
-                result = self.vm.create()
-            elif self.operation == "start":
-                self.progress.emit("Starting VM...")
-                result = self.vm.start()
-            elif self.operation == "stop":
-                self.progress.emit("Stopping VM...")
-                result = self.vm.stop()
-            elif self.operation == "delete":
-                self.progress.emit("Deleting VM...")
-                result = self.vm.delete()
+            message, operation = self._OPS[self.operation]
+            self.progress.emit(message)
+            result = operation(self.vm)
             
             self.finished.emit(result, f"{self.operation.capitalize()} operation completed")
         except Exception as e:
@@ -49,22 +57,94 @@ class WindowsVMManager(QMainWindow):
         self.setMinimumSize(800, 600)
         
         # VM storage directory
-        self.vm_base_dir = Path.home() / "VirtualMachines"
+        self.vm_base_dir = DEFAULT_VM_BASE_DIR
         os.makedirs(self.vm_base_dir, exist_ok=True)
         
-        # Current VM list
-        self.vms = self._scan_vms()
+        # Reused WindowsVM instances, keyed by VM name
+        self._vm_cache = {}
+        
+        # vm_name -> VM directory, filled in by each list refresh
+        self._vm_paths = {}
+        
+        # vm_name -> (mtime, size, label) for the details tab disk label
+        self._disk_stat_cache = {}
+        
+        # Workers still running; held so a second click can't GC one mid-run
+        self._workers = set()
+        
+        # Names of VMs with an operation in flight; each VM's shared
+        # WindowsVM instance is only used by one worker at a time
+        self._busy_vms = set()
         
         self.init_ui()
     
     def _scan_vms(self):
-        """Scan for existing VMs in the VM directory"""
-        vms = []
-        if self.vm_base_dir.exists():
-            for vm_dir in self.vm_base_dir.iterdir():
-                if vm_dir.is_dir():
-                    vms.append(vm_dir.name)
-        return vms
+        """Yield (name, path) for existing VMs in the VM directory"""
+        # DirEntry.is_dir() reuses the type from the directory read, so no
+        # extra stat is needed per entry
+        try:
+            it = os.scandir(self.vm_base_dir)
+        except FileNotFoundError:
+            return
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield entry.name, entry.path
+    
+    def _get_vm(self, vm_name, **overrides):
+        """Return the cached WindowsVM for vm_name, creating it on first use"""
+        vm = self._vm_cache.get(vm_name)
+        if vm is None:
+            vm = WindowsVM(
+                vm_name=vm_name,
+                vm_path=self._vm_paths[vm_name]
+            )
+            self._vm_cache[vm_name] = vm
+        for attr, value in overrides.items():
+            setattr(vm, attr, value)
+        return vm
+    
+    def _is_busy(self, vm_name):
+        """Report and return whether vm_name already has an operation running"""
+        if vm_name in self._busy_vms:
+            self.update_status(f"VM '{vm_name}' is busy, wait for the current operation")
+            return True
+        return False
+    
+    def _set_vm_buttons_enabled(self, enabled):
+        self.start_btn.setEnabled(enabled)
+        self.stop_btn.setEnabled(enabled)
+        self.delete_btn.setEnabled(enabled)
+    
+    def _run_operation(self, operation, vm):
+        """Run a VM operation on a worker thread"""
+        worker = VMWorker(operation, vm)
+        worker.progress.connect(self.update_status)
+        worker.finished.connect(self.on_operation_finished)
+        self._workers.add(worker)
+        self._busy_vms.add(vm.vm_name)
+        self.on_vm_selected(self.vm_list.currentIndex(), QModelIndex())
+        worker.start()
+    
+    def _populate_vm_list(self):
+        """Rescan the VM directory, keeping the UI responsive while it runs"""
+        # Built aside so handlers run by processEvents() see the old mapping
+        vm_paths = {}
+        for count, (name, path) in enumerate(self._scan_vms(), 1):
+            vm_paths[name] = path
+            if count % 64 == 0:
+                QApplication.processEvents()
+        self._vm_paths = vm_paths
+        # One model reset instead of a widget item per VM, with repaints and
+        # selection signals held off until it is done
+        selection = self.vm_list.selectionModel()
+        self.vm_list.setUpdatesEnabled(False)
+        selection.blockSignals(True)
+        try:
+            self._vm_model.setStringList(list(self._vm_paths))
+        finally:
+            selection.blockSignals(False)
+            self.vm_list.setUpdatesEnabled(True)
     
     def init_ui(self):
         # Main widget and layout
@@ -79,9 +159,11 @@ class WindowsVMManager(QMainWindow):
         vm_group = QGroupBox("Virtual Machines")
         vm_layout = QVBoxLayout()
         
-        self.vm_list = QListWidget()
-        self.vm_list.addItems(self.vms)
-        self.vm_list.currentItemChanged.connect(self.on_vm_selected)
+        self.vm_list = QListView()
+        self._vm_model = QStringListModel(self)
+        self.vm_list.setModel(self._vm_model)
+        self._populate_vm_list()
+        self.vm_list.selectionModel().currentChanged.connect(self.on_vm_selected)
         vm_layout.addWidget(self.vm_list)
         
         # VM Controls
@@ -224,11 +306,14 @@ class WindowsVMManager(QMainWindow):
             QMessageBox.warning(self, "Error", "VM name cannot be empty")
             return
         
+        if self._is_busy(vm_name):
+            return
+        
         if not iso_path:
             QMessageBox.warning(self, "Error", "Windows ISO path is required")
             return
         
-        if not os.path.exists(iso_path):
+        if not _is_iso_file(iso_path):
             QMessageBox.warning(self, "Error", "ISO file does not exist")
             return
         
@@ -241,97 +326,92 @@ class WindowsVMManager(QMainWindow):
             vm_path=str(self.vm_base_dir / vm_name)
         )
         
-        # Create worker thread
-        self.worker = VMWorker("create", vm)
-        self.worker.progress.connect(self.update_status)
-        self.worker.finished.connect(self.on_operation_finished)
-        self.worker.start()
+        self._run_operation("create", vm)
+    
+    def _disk_label(self, vm_name, disk_path, disk_name):
+        """Describe a VM's disk, reusing the last label if the disk is unchanged"""
+        try:
+            st = os.stat(disk_path)
+        except FileNotFoundError:
+            self._disk_stat_cache.pop(vm_name, None)
+            return "Disk not found"
+        
+        cached = self._disk_stat_cache.get(vm_name)
+        if cached and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+        
+        size_mb = st.st_size / (1024 * 1024)
+        label = f"{disk_name} ({size_mb:.1f} MB used)"
+        self._disk_stat_cache[vm_name] = (st.st_mtime, st.st_size, label)
+        return label
     
     def on_vm_selected(self, current, previous):
-        if current:
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(True)
-            self.delete_btn.setEnabled(True)
+        if current.isValid():
+            vm_name = current.data()
+            self._set_vm_buttons_enabled(vm_name not in self._busy_vms)
             
             # Update details tab
-            vm_name = current.text()
-            vm_path = self.vm_base_dir / vm_name
-            disk_path = vm_path / f"{vm_name}.qcow2"
+            vm_path = self._vm_paths[vm_name]
+            disk_name = f"{vm_name}.qcow2"
+            disk_path = os.path.join(vm_path, disk_name)
             
             self.details_name.setText(vm_name)
-            self.details_path.setText(str(vm_path))
+            self.details_path.setText(vm_path)
             
-            if disk_path.exists():
-                size_mb = disk_path.stat().st_size / (1024 * 1024)
-                self.details_disk.setText(f"{disk_path.name} ({size_mb:.1f} MB used)")
-            else:
-                self.details_disk.setText("Disk not found")
+            self.details_disk.setText(self._disk_label(vm_name, disk_path, disk_name))
             
             # Check if VM is running (simplified)
             self.details_status.setText("Unknown")
         else:
-            self.start_btn.setEnabled(False)
-            self.stop_btn.setEnabled(False)
-            self.delete_btn.setEnabled(False)
+            self._set_vm_buttons_enabled(False)
     
     def start_vm(self):
-        current_vm = self.vm_list.currentItem()
-        if current_vm:
-            vm_name = current_vm.text()
-            vm = WindowsVM(
-                vm_name=vm_name,
-                vm_path=str(self.vm_base_dir / vm_name)
-            )
+        current_vm = self.vm_list.currentIndex()
+        if current_vm.isValid():
+            vm_name = current_vm.data()
+            if self._is_busy(vm_name):
+                return
+            vm = self._get_vm(vm_name, iso_path=None)
             
-            self.worker = VMWorker("start", vm)
-            self.worker.progress.connect(self.update_status)
-            self.worker.finished.connect(self.on_operation_finished)
-            self.worker.start()
+            self._run_operation("start", vm)
     
     def start_with_iso(self):
-        current_vm = self.vm_list.currentItem()
-        if current_vm:
-            vm_name = current_vm.text()
+        current_vm = self.vm_list.currentIndex()
+        if current_vm.isValid():
+            vm_name = current_vm.data()
+            if self._is_busy(vm_name):
+                return
             iso_path = self.boot_iso_path.text()
             
             if not iso_path:
                 QMessageBox.warning(self, "Error", "Please select an ISO file")
                 return
             
-            if not os.path.exists(iso_path):
+            if not _is_iso_file(iso_path):
                 QMessageBox.warning(self, "Error", "ISO file does not exist")
                 return
             
-            vm = WindowsVM(
-                vm_name=vm_name,
-                vm_path=str(self.vm_base_dir / vm_name),
-                iso_path=iso_path
-            )
+            vm = self._get_vm(vm_name, iso_path=iso_path)
             
-            self.worker = VMWorker("start", vm)
-            self.worker.progress.connect(self.update_status)
-            self.worker.finished.connect(self.on_operation_finished)
-            self.worker.start()
+            self._run_operation("start", vm)
     
     def stop_vm(self):
-        current_vm = self.vm_list.currentItem()
-        if current_vm:
-            vm_name = current_vm.text()
-            vm = WindowsVM(
-                vm_name=vm_name,
-                vm_path=str(self.vm_base_dir / vm_name)
-            )
+        current_vm = self.vm_list.currentIndex()
+        if current_vm.isValid():
+            vm_name = current_vm.data()
+            if self._is_busy(vm_name):
+                return
+            vm = self._get_vm(vm_name)
             vm.vm_running = True  # Assume it's running
             
-            self.worker = VMWorker("stop", vm)
-            self.worker.progress.connect(self.update_status)
-            self.worker.finished.connect(self.on_operation_finished)
-            self.worker.start()
+            self._run_operation("stop", vm)
     
     def delete_vm(self):
-        current_vm = self.vm_list.currentItem()
-        if current_vm:
-            vm_name = current_vm.text()
+        current_vm = self.vm_list.currentIndex()
+        if current_vm.isValid():
+            vm_name = current_vm.data()
+            if self._is_busy(vm_name):
+                return
             
             reply = QMessageBox.question(
                 self, "Confirm Delete",
@@ -339,35 +419,45 @@ class WindowsVMManager(QMainWindow):
                 QMessageBox.Yes | QMessageBox.No, QMessageBox.No
             )
             
-            if reply == QMessageBox.Yes:
-                vm = WindowsVM(
-                    vm_name=vm_name,
-                    vm_path=str(self.vm_base_dir / vm_name)
-                )
+            # Another operation may have started while the dialog was open
+            if reply == QMessageBox.Yes and not self._is_busy(vm_name):
+                vm = self._get_vm(vm_name)
                 
-                self.worker = VMWorker("delete", vm)
-                self.worker.progress.connect(self.update_status)
-                self.worker.finished.connect(self.on_operation_finished)
-                self.worker.start()
+                self._run_operation("delete", vm)
     
     def refresh_vms(self):
-        self.vms = self._scan_vms()
-        self.vm_list.clear()
-        self.vm_list.addItems(self.vms)
+        self._populate_vm_list()
+        # Selection signals were blocked during the reset, so sync up once
+        self.on_vm_selected(self.vm_list.currentIndex(), QModelIndex())
         self.update_status("VM list refreshed")
     
     def update_status(self, message):
         self.status_label.setText(message)
     
     def on_operation_finished(self, success, message):
+        worker = self.sender()
+        # The result is the last thing run() emits, so this only waits for
+        # the thread to return
+        worker.wait()
+        self._workers.discard(worker)
+        self._busy_vms.discard(worker.vm.vm_name)
+        
+        if worker.operation == "delete":
+            self._vm_cache.pop(worker.vm.vm_name, None)
+        elif worker.operation == "create" and success:
+            # Reuse the new instance so its first start skips the disk stat
+            self._vm_cache[worker.vm.vm_name] = worker.vm
+        
         if success:
             self.update_status(message)
             self.refresh_vms()
         else:
+            self.on_vm_selected(self.vm_list.currentIndex(), QModelIndex())
             QMessageBox.warning(self, "Operation Failed", message)
             self.update_status("Operation failed")
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     app = QApplication(sys.argv)
     window = WindowsVMManager()
     window.show()
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 import argparse
+import logging
 import os
+import sys
 from windows_vm import WindowsVM
 
 def main():
     parser = argparse.ArgumentParser(description="Windows Virtual Machine Manager")
+    # Defaults for options not every subcommand defines
+    parser.set_defaults(memory="4096", disk="50G", iso=None, path=None)
     
     # Create subparsers for commands
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
@@ -34,6 +38,7 @@ def main():
     delete_parser.add_argument("--path", help="Directory where VM files are stored")
     
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     
     if not args.command:
         parser.print_help()
@@ -42,10 +47,10 @@ def main():
     # Initialize VM
     vm = WindowsVM(
         vm_name=args.name,
-        memory=args.memory if hasattr(args, 'memory') else "4096",
-        disk_size=args.disk if hasattr(args, 'disk') else "50G",
-        iso_path=args.iso if hasattr(args, 'iso') else None,
-        vm_path=args.path if hasattr(args, 'path') else None
+        memory=args.memory,
+        disk_size=args.disk,
+        iso_path=args.iso,
+        vm_path=args.path
     )
     
     # Execute command
@@ -54,6 +59,8 @@ def main():
     elif args.command == "start":
         vm.start()
     elif args.command == "stop":
+        # Each CLI run starts with a fresh WindowsVM, so assume it's running
+        vm.vm_running = True
         vm.stop()
     elif args.command == "delete":
         vm.delete()
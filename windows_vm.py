@@ -1,9 +1,54 @@
+import functools
+import logging
 import os
 import subprocess
 import platform
+import shlex
+import shutil
 import time
 from pathlib import Path
 
+log = logging.getLogger(__name__)
+
+# Directory holding one subdirectory per VM unless another path is given
+DEFAULT_VM_BASE_DIR = Path.home() / "VirtualMachines"
+
+# Cached so the platform probe (and the PowerShell subprocess on Windows)
+# only runs once per process rather than once per WindowsVM instance
+@functools.lru_cache(maxsize=1)
+def _detect_virtualization_tool():
+    """Detect the appropriate virtualization tool based on the platform"""
+    system = platform.system().lower()
+
+    if system == "windows":
+        # Check for Hyper-V or VirtualBox
+        try:
+            subprocess.run(["powershell", "Get-Command", "Get-VM"], 
+                          check=True, capture_output=True)
+            return "hyperv"
+        except subprocess.CalledProcessError:
+            return "virtualbox"
+    elif system == "darwin":  # macOS
+        return "virtualbox"
+    else:  # Linux
+        # Check for KVM
+        if os.path.exists("/dev/kvm"):
+            return "qemu"
+        else:
+            return "virtualbox"
+
+
+# Display, network and input arguments shared by every QEMU launch
+_QEMU_STATIC_TAIL = (
+    "-display", "gtk,grab-on-hover=on",
+    "-vga", "virtio",  # Better graphics performance
+    "-device", "virtio-net,netdev=net0",
+    "-netdev", "user,id=net0",
+    "-usb",
+    "-device", "usb-tablet",  # Better mouse integration
+)
+
+
 class WindowsVM:
     def __init__(self, vm_name="WindowsVM", memory="4096", disk_size="50G", 
                  iso_path=None, vm_path=None):
@@ -25,34 +70,19 @@ class WindowsVM:
         if vm_path:
             self.vm_path = Path(vm_path)
         else:
-            self.vm_path = Path.home() / "VirtualMachines" / vm_name
+            self.vm_path = DEFAULT_VM_BASE_DIR / vm_name
             
         self.disk_path = self.vm_path / f"{vm_name}.qcow2"
+        self._drive_arg = f"file={self.disk_path},format=qcow2,if=virtio"
         self.vm_running = False
+        self._qemu_proc = None
+        # Whether the last stop() returned only once the VM was down
+        self._stop_confirmed = False
+        # Disk size known without a stat (e.g. right after creation)
+        self._disk_size_cached = None
         
         # Detect the virtualization tool based on platform
-        self.virtualization_tool = self._detect_virtualization_tool()
-    
-    def _detect_virtualization_tool(self):
-        """Detect the appropriate virtualization tool based on the platform"""
-        system = platform.system().lower()
-        
-        if system == "windows":
-            # Check for Hyper-V or VirtualBox
-            try:
-                subprocess.run(["powershell", "Get-Command", "Get-VM"], 
-                              check=True, capture_output=True)
-                return "hyperv"
-            except subprocess.CalledProcessError:
-                return "virtualbox"
-        elif system == "darwin":  # macOS
-            return "virtualbox"
-        else:  # Linux
-            # Check for KVM
-            if os.path.exists("/dev/kvm"):
-                return "qemu"
-            else:
-                return "virtualbox"
+        self.virtualization_tool = _detect_virtualization_tool()
     
     def create(self):
         """Create a new Windows VM"""
@@ -78,10 +108,22 @@ class WindowsVM:
             "qemu-img", "create", "-f", "qcow2", 
             str(self.disk_path), self.disk_size
         ], check=True)
+        # A freshly created qcow2 image holds no data yet
+        self._disk_size_cached = 0
         
-        print(f"Created Windows VM disk at {self.disk_path}")
+        log.info("Created Windows VM disk at %s", self.disk_path)
         return True
     
+    def _run_ps(self, *commands):
+        """Run PowerShell commands in a single process"""
+        # Starting PowerShell costs far more than the cmdlets themselves, so
+        # batch them; stop on the first error like separate check=True runs
+        script = "; ".join(("$ErrorActionPreference = 'Stop'",) + commands)
+        subprocess.run(
+            ["powershell", "-NoProfile", "-NonInteractive", "-Command", script],
+            check=True
+        )
+    
     def _create_hyperv(self):
         """Create VM using Hyper-V"""
         # Create VM using PowerShell
@@ -94,10 +136,9 @@ class WindowsVM:
             f"Set-VMFirmware -VMName '{self.vm_name}' -FirstBootDevice (Get-VMDvdDrive -VMName '{self.vm_name}')"
         ]
         
-        for cmd in ps_commands:
-            subprocess.run(["powershell", "-Command", cmd], check=True)
+        self._run_ps(*ps_commands)
         
-        print(f"Created Windows VM '{self.vm_name}' using Hyper-V")
+        log.info("Created Windows VM '%s' using Hyper-V", self.vm_name)
         return True
     
     def _create_virtualbox(self):
@@ -149,12 +190,16 @@ class WindowsVM:
             "--medium", str(self.iso_path)
         ], check=True)
         
-        print(f"Created Windows VM '{self.vm_name}' using VirtualBox")
+        log.info("Created Windows VM '%s' using VirtualBox", self.vm_name)
         return True
     
     def start(self):
         """Start the Windows VM"""
         if self.virtualization_tool == "qemu":
+            if self._qemu_proc is not None and self._qemu_proc.poll() is None:
+                log.warning("VM '%s' is already running", self.vm_name)
+                return False
+            
             # Start VM with QEMU
             cmd = [
                 "qemu-system-x86_64", 
@@ -162,113 +207,195 @@ class WindowsVM:
                 "-m", self.memory,
                 "-smp", "cores=2,threads=2",  # Better CPU configuration
                 "-cpu", "host",  # Use host CPU model for better performance
-                "-drive", f"file={self.disk_path},format=qcow2,if=virtio",  # Use virtio for better disk performance
+                "-drive", self._drive_arg,  # Use virtio for better disk performance
             ]
             
             # Add ISO if specified
             if self.iso_path:
                 cmd.extend(["-cdrom", self.iso_path])
                 # Force boot from CD if it's likely a fresh install
-                if os.path.exists(self.disk_path) and os.path.getsize(self.disk_path) < 1000000000:
+                disk_bytes = self._disk_size_cached
+                if disk_bytes is None:
+                    try:
+                        disk_bytes = os.stat(self.disk_path).st_size
+                    except FileNotFoundError:
+                        disk_bytes = -1
+                if 0 <= disk_bytes < 10**9:
                     cmd.extend(["-boot", "d"])
-                    print("Booting from ISO for installation...")
+                    log.info("Booting from ISO for installation...")
                 else:
-                    print("ISO provided but booting from disk first...")
+                    log.info("ISO provided but booting from disk first...")
             else:
-                print("No ISO provided, booting from disk...")
+                log.info("No ISO provided, booting from disk...")
             
             # Add display and network with better performance
-            cmd.extend([
-                "-display", "gtk,grab-on-hover=on",
-                "-vga", "virtio",  # Better graphics performance
-                "-device", "virtio-net,netdev=net0",
-                "-netdev", "user,id=net0",
-                "-usb",
-                "-device", "usb-tablet",  # Better mouse integration
-            ])
+            cmd += _QEMU_STATIC_TAIL
             
             # Run in foreground for better visibility of issues
-            print(f"Starting QEMU with command: {' '.join(cmd)}")
-            print("Windows VM is starting. This may take a few minutes, especially for first boot...")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Starting QEMU with command: %s", shlex.join(cmd))
+            log.info("Windows VM is starting. This may take a few minutes, especially for first boot...")
             
-            # Use Popen with stdout/stderr redirection to see any errors
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            # Send QEMU's output straight to a log file; an unread pipe would
+            # eventually fill up and block it
+            log_path = self.vm_path / "qemu.log"
+            try:
+                log_file = open(log_path, "ab", buffering=0)
+            except OSError as e:
+                log.error("Error starting VM: cannot open %s: %s", log_path, e)
+                return False
+            with log_file:
+                log_offset = log_file.tell()
+                process = subprocess.Popen(
+                    cmd, 
+                    stdout=log_file, 
+                    stderr=subprocess.STDOUT
+                )
+            
+            # The guest writes to the disk from here on, so stat it next time
+            self._disk_size_cached = None
             
             # Check if process started successfully
+            time.sleep(0.2)
             if process.poll() is None:
-                print("QEMU process started successfully. VM window should appear shortly.")
+                # Only keep the handle once QEMU is known to be running
+                self._qemu_proc = process
+                log.info("QEMU process started successfully. VM window should appear shortly.")
             else:
-                stdout, stderr = process.communicate(timeout=5)
-                print(f"Error starting VM: {stderr}")
+                with open(log_path, "rb") as log_file:
+                    log_file.seek(log_offset)
+                    output = log_file.read().decode(errors="replace")
+                log.error("Error starting VM: %s", output)
                 return False
             
         elif self.virtualization_tool == "hyperv":
             # Start VM with Hyper-V
-            subprocess.run(["powershell", "-Command", f"Start-VM -Name '{self.vm_name}'"], check=True)
+            self._run_ps(f"Start-VM -Name '{self.vm_name}'")
             
         elif self.virtualization_tool == "virtualbox":
             # Start VM with VirtualBox
             subprocess.run(["VBoxManage", "startvm", self.vm_name], check=True)
         
         self.vm_running = True
-        print(f"Started Windows VM '{self.vm_name}'")
+        log.info("Started Windows VM '%s'", self.vm_name)
         return True
     
     def stop(self):
         """Stop the Windows VM"""
         if not self.vm_running:
-            print(f"VM '{self.vm_name}' is not running")
+            log.info("VM '%s' is not running", self.vm_name)
             return False
         
         if self.virtualization_tool == "qemu":
-            # This is a simplified approach - in a real implementation, you'd want to
-            # use a more graceful shutdown method
-            subprocess.run(["pkill", "-f", f"qemu-system-x86_64.*{self.disk_path}"], check=False)
+            process, self._qemu_proc = self._qemu_proc, None
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                self._stop_confirmed = True
+            else:
+                # Started outside this object (e.g. by an earlier CLI run) or
+                # our handle has already exited; fall back to matching the
+                # command line
+                subprocess.run(["pkill", "-f", f"qemu-system-x86_64.*{self.disk_path}"], check=False)
+                self._stop_confirmed = False
             
         elif self.virtualization_tool == "hyperv":
-            subprocess.run(["powershell", "-Command", f"Stop-VM -Name '{self.vm_name}' -Force"], check=True)
+            # Stop-VM -Force only returns once the VM is off
+            self._run_ps(f"Stop-VM -Name '{self.vm_name}' -Force")
+            self._stop_confirmed = True
             
         elif self.virtualization_tool == "virtualbox":
             subprocess.run(["VBoxManage", "controlvm", self.vm_name, "acpipowerbutton"], check=True)
+            self._stop_confirmed = False
         
         self.vm_running = False
-        print(f"Stopped Windows VM '{self.vm_name}'")
+        log.info("Stopped Windows VM '%s'", self.vm_name)
+        return True
+    
+    def _is_running(self):
+        """Check whether the VM's process or machine is still up"""
+        if self.virtualization_tool == "qemu":
+            result = subprocess.run(
+                ["pgrep", "-f", f"qemu-system-x86_64.*{self.disk_path}"],
+                capture_output=True
+            )
+            return result.returncode == 0
+        
+        elif self.virtualization_tool == "virtualbox":
+            result = subprocess.run(
+                ["VBoxManage", "showvminfo", self.vm_name, "--machinereadable"],
+                capture_output=True, text=True
+            )
+            for line in result.stdout.splitlines():
+                key, _, value = line.partition("=")
+                if key == "VMState":
+                    return value.strip('"') not in ("poweroff", "aborted", "saved")
+            return False
+        
+        return False
+    
+    def _wait_until_stopped(self, timeout=10):
+        """Poll until the VM has stopped; return False if timeout runs out"""
+        deadline = time.monotonic() + timeout
+        while self._is_running():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
         return True
     
+    def _force_stop(self):
+        """Power the VM off without waiting for the guest to shut down"""
+        if self.virtualization_tool == "qemu":
+            subprocess.run(["pkill", "-9", "-f", f"qemu-system-x86_64.*{self.disk_path}"], check=False)
+        elif self.virtualization_tool == "virtualbox":
+            subprocess.run(["VBoxManage", "controlvm", self.vm_name, "poweroff"], check=False)
+    
     def delete(self):
         """Delete the Windows VM and its files"""
         # First stop the VM if it's running
         if self.vm_running:
             self.stop()
-            time.sleep(2)  # Give it time to stop
+            if not self._stop_confirmed and not self._wait_until_stopped():
+                # Guests often take longer than this to shut down over ACPI,
+                # and the VM can't be removed while it is still up
+                log.warning("VM '%s' did not stop in time, forcing it off", self.vm_name)
+                self._force_stop()
+                if not self._wait_until_stopped(timeout=5):
+                    log.warning("VM '%s' is still running after being forced off", self.vm_name)
         
-        if self.virtualization_tool == "qemu":
-            # For QEMU, just delete the disk file
-            if os.path.exists(self.disk_path):
-                os.remove(self.disk_path)
-                
-        elif self.virtualization_tool == "hyperv":
+        # QEMU has nothing registered outside the VM directory; its disk is
+        # removed with the directory below
+        if self.virtualization_tool == "hyperv":
             # Remove VM using Hyper-V PowerShell
-            subprocess.run(["powershell", "-Command", f"Remove-VM -Name '{self.vm_name}' -Force"], check=True)
-            
-            # Delete disk file
-            if os.path.exists(self.disk_path):
-                os.remove(self.disk_path)
+            self._run_ps(f"Remove-VM -Name '{self.vm_name}' -Force")
                 
         elif self.virtualization_tool == "virtualbox":
             # Unregister and delete VM
             subprocess.run(["VBoxManage", "unregistervm", self.vm_name, "--delete"], check=True)
         
-        # Remove VM directory if it exists and is empty
-        try:
-            os.rmdir(self.vm_path)
-        except (OSError, FileNotFoundError):
-            pass
+        if self.vm_path.resolve() == (DEFAULT_VM_BASE_DIR / self.vm_name).resolve():
+            # Our own VM directory: remove it along with any disks, logs and
+            # nvram left in it
+            if self.vm_path.exists():
+                shutil.rmtree(self.vm_path)
+        else:
+            # A user-supplied --path may hold unrelated files, so only remove
+            # what we created and then the directory if that left it empty
+            for path in (self.disk_path, self.vm_path / "qemu.log"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            try:
+                os.rmdir(self.vm_path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                log.warning("Left %s in place: it still contains other files", self.vm_path)
         
-        print(f"Deleted Windows VM '{self.vm_name}'")
+        log.info("Deleted Windows VM '%s'", self.vm_name)
         return True 
\ No newline at end of file